@@ -3,84 +3,95 @@ import os
 import sys
 from collections import OrderedDict
 import random
+import hashlib
+import zipfile
+import numpy as np
+from iwad_index import IWADIndex
 
 class WADGenerator:
-    def __init__(self, maze_file=None):
+    def __init__(self, maze_file=None, iwad_file=None, random_theme=False):
         self.maze_file = maze_file
+        self.random_theme = random_theme
+        # Texture/flat index of the IWAD, used to validate resource names
+        self.iwad_index = IWADIndex.load(iwad_file) if iwad_file else None
         
-    def parse_maze_file(self):
+    def validate_resources(self, sidedefs, sectors):
+        """Check SIDEDEFS/SECTORS texture names against the IWAD index"""
+        if self.iwad_index is None:
+            return True
+        bad_textures = self.iwad_index.check_sidedefs(sidedefs)
+        bad_flats = self.iwad_index.check_sectors(sectors)
+        for i, tex in bad_textures:
+            print(f"Warning: sidedef {i} uses unknown texture {tex}")
+        for i, flat in bad_flats:
+            print(f"Warning: sector {i} uses unknown flat {flat}")
+        return not bad_textures and not bad_flats
+        
+    def parse_maze_file(self, maze_file=None):
         """Parse the maze file and return grid and dimensions"""
-        if not self.maze_file or not os.path.exists(self.maze_file):
+        maze_file = maze_file or self.maze_file
+        if not maze_file or not os.path.exists(maze_file):
             return None, None, None
             
-        with open(self.maze_file, 'r') as f:
-            lines = f.readlines()
+        with open(maze_file, 'r') as f:
+            values = f.read().split()
             
-        # First line is dimensions
-        width, height = map(int, lines[0].strip().split())
-        grid = []
-        
-        for line in lines[1:]:
-            row = list(map(int, line.strip().split()))
-            grid.append(row)
+        # First line is dimensions, the rest is the cell grid
+        width, height = int(values[0]), int(values[1])
+        grid = np.array(values[2:2 + width * height], dtype=np.int32).reshape(height, width)
             
         return width, height, grid
     
     def create_maze_geometry(self, width, height, grid):
-        """Create vertices, linedefs and sidedefs based on maze grid"""
+        """Create vertices, linedefs and sidedefs based on maze grid
+        
+        Works on the whole grid at once: vertices is an (N, 2) array and
+        linedefs an (M, 2) array of start/end vertex ids; the constant
+        wall fields are added by pack_linedefs.
+        """
         cell_size = 128  # Size of each cell in map units
-        vertices = []
-        linedefs = []
+        grid = np.asarray(grid)
         sidedefs = []
         
         # First, create all the vertices for each cell corner
-        vertex_grid = []
-        for y in range(height + 1):
-            row = []
-            for x in range(width + 1):
-                vertex_x = x * cell_size
-                vertex_y = y * cell_size
-                vertices.append((vertex_x, vertex_y))
-                row.append(len(vertices) - 1)
-            vertex_grid.append(row)
+        # (vertex id of corner (x, y) is y * (width + 1) + x)
+        vertices = np.empty(((height + 1) * (width + 1), 2), dtype=np.int32)
+        corners = vertices.reshape(height + 1, width + 1, 2)
+        corners[..., 0] = np.arange(width + 1, dtype=np.int32) * cell_size
+        corners[..., 1] = (np.arange(height + 1, dtype=np.int32) * cell_size)[:, None]
+        
+        row = width + 1
         
         # Now create walls based on cell data
-        for y in range(height):
-            for x in range(width):
-                cell = grid[y][x]
-                
-                # Check each bit for walls (assuming bits represent walls in N, E, S, W order)
-                # Bottom
-                if cell & 0b0010:
-                    v1 = vertex_grid[y][x]
-                    v2 = vertex_grid[y][x+1]
-                    linedefs.append((v1, v2, 1, 0, 0, 0, 0xFFFF))
-                
-                # Right
-                if cell & 0b0100:
-                    v1 = vertex_grid[y][x+1]
-                    v2 = vertex_grid[y+1][x+1]
-                    linedefs.append((v1, v2, 1, 0, 0, 0, 0xFFFF))
-                
-                # Top
-                if cell & 0b1000:
-                    v1 = vertex_grid[y+1][x+1]
-                    v2 = vertex_grid[y+1][x]
-                    linedefs.append((v1, v2, 1, 0, 0, 0, 0xFFFF))
-                
-                # Left
-                if cell & 0b0001:
-                    v1 = vertex_grid[y+1][x]
-                    v2 = vertex_grid[y][x]
-                    linedefs.append((v1, v2, 1, 0, 0, 0, 0xFFFF))
+        # bit: (start corner offset, end corner offset) relative to the
+        # cell's (x, y) corner
+        walls = [
+            (0b0010, 0, 1),              # Bottom
+            (0b0100, 1, row + 1),        # Right
+            (0b1000, row + 1, row),      # Top
+            (0b0001, row, 0),            # Left
+        ]
+        cells = grid.reshape(-1).astype(np.uint8)  # Cell values are < 32
+        masks = [(cells & bit) != 0 for bit, _, _ in walls]
+        counts = [int(np.count_nonzero(m)) for m in masks]
+        
+        # Single preallocated start/end table; each direction fills its slice
+        linedefs = np.empty((sum(counts), 2), dtype=np.int32)
+        pos = 0
+        for (bit, start, end), mask, count in zip(walls, masks, counts):
+            cell = np.flatnonzero(mask).astype(np.int32)
+            v = cell + cell // width  # vertex id of the cell's (x, y) corner
+            linedefs[pos:pos + count, 0] = v + start
+            linedefs[pos:pos + count, 1] = v + end
+            pos += count
         
         return vertices, linedefs, sidedefs
     
     def create_simple_blockmap(self, vertices, width, height):
         """Create a minimal blockmap"""
         # Blockmap header
-        origin_x = min(v[0] for v in vertices)
-        origin_y = min(v[1] for v in vertices)
+        origin_x = int(vertices[:, 0].min())
+        origin_y = int(vertices[:, 1].min())
         blocks_x = (width // 128) + 1
         blocks_y = (height // 128) + 1
         
@@ -95,19 +106,19 @@ class WADGenerator:
         
         return bytes(data)
 
-    def create_simple_map(self):
+    def create_simple_map(self, maze_file=None):
         """Create a simple map with monsters, items and exit"""
         # Try to parse maze file first
-        maze_width, maze_height, grid = self.parse_maze_file()
+        maze_width, maze_height, grid = self.parse_maze_file(maze_file)
         block = 128
-        if grid:
+        if grid is not None:
             # Create maze geometry
             vertices_, linedefs_, sidedefs_ = self.create_maze_geometry(maze_width, maze_height, grid)
             map_width = maze_width * block
             map_height = maze_height * block
         else:
-            vertices_ = []
-            linedefs_ = []
+            vertices_ = np.empty((0, 2), dtype=np.int32)
+            linedefs_ = np.empty((0, 2), dtype=np.int32)
             map_width = 8 * block
             map_height = 10 * block
 
@@ -120,14 +131,11 @@ class WADGenerator:
             (map_width-line, map_height-line), # 1
             (map_width-line, line+0),     # 2
             (line+0, line+0),         # 3
+            (line+line+0, line+line+0),  # Exit
+            (line+line+0, line+line+block),  # Exit
         ]
         
-        vertices = vertices_ + vertices
-        #vertices = vertices_ 
-        #vertices = []
-
-        vertices.append((line+line+0, line+line+0))  # Exit
-        vertices.append((line+line+0, line+line+block))  # Exit
+        vertices = np.concatenate([vertices_, np.array(vertices, dtype=np.int32)])
         
 
         # Outer boundary linedefs
@@ -138,12 +146,9 @@ class WADGenerator:
             (n+1, n+2, 1, 0, 0, 0, 0xFFFF),  # Right wall
             (n+2, n+3, 1, 0, 0, 0, 0xFFFF),  # Top wall (exit)(n+2, n+3, 5, 11, 666, 0, 0xFFFF),  # Top wall (exit)
             (n+3, n+0, 1, 0, 0, 0, 0xFFFF),    # Left wall
+            (n+4, n+5, 5, 11, 666, 1, 0xFFFF),  # Top wall (exit)  # Exit
         ]
         
-        linedefs = linedefs_ + linedefs
-        #linedefs = linedefs_
-        #linedefs=[]
-        linedefs.append((n+4, n+5, 5, 11, 666, 1, 0xFFFF))  # Top wall (exit)  # Exit
         
         # Sidedefs
         sidedefs = [
@@ -160,6 +165,16 @@ class WADGenerator:
             (0, wall_height, "MFLR8_1", "MFLR8_1", 250, 0, 0),  # Inner area
         ]
         
+        # Random texture theme drawn from the IWAD's valid resources
+        if self.random_theme and self.iwad_index:
+            wall = self.iwad_index.random_texture()
+            floor = self.iwad_index.random_flat()
+            ceiling = self.iwad_index.random_flat()
+            sidedefs[0] = (0, 0, wall, wall, wall, 0)
+            sectors[0] = (0, wall_height, floor, ceiling, 192, 0, 0)
+        
+        self.validate_resources(sidedefs, sectors)
+        
         # Things - position them randomly in the maze cells
         things = [
             # Player start (random position)
@@ -190,7 +205,7 @@ class WADGenerator:
         
         return {
             'THINGS': self.pack_things(things),
-            'LINEDEFS': self.pack_linedefs(linedefs),
+            'LINEDEFS': self.pack_linedefs(linedefs_) + self.pack_linedefs(linedefs),
             'SIDEDEFS': self.pack_sidedefs(sidedefs),
             'VERTEXES': self.pack_vertexes(vertices),
             'SECTORS': self.pack_sectors(sectors),
@@ -205,11 +220,24 @@ class WADGenerator:
         return bytes(data)
     
     def pack_linedefs(self, linedefs):
-        """Pack linedefs data into binary format"""
-        data = bytearray()
-        for ld in linedefs:
-            data += struct.pack('<HHHHHHH', *ld)
-        return bytes(data)
+        """Pack linedefs data into binary format
+        
+        Accepts full (M, 7) records or (M, 2) start/end pairs of plain
+        one-sided maze walls.
+        """
+        linedefs = np.asarray(linedefs)
+        columns = linedefs.shape[-1] if linedefs.ndim == 2 else 7
+        linedefs = linedefs.reshape(-1, columns)
+        if linedefs.size and (linedefs.min() < 0 or linedefs.max() > 0xFFFF):
+            raise ValueError("Linedef field out of unsigned 16-bit range (map too large)")
+        if columns == 7:
+            return linedefs.astype('<u2').tobytes()
+        
+        # Write straight into the output buffer: start, end + wall constants
+        data = np.empty((len(linedefs), 7), dtype='<u2')
+        data[:, :2] = linedefs
+        data[:, 2:] = (1, 0, 0, 0, 0xFFFF)
+        return data.tobytes()
     
     def pack_sidedefs(self, sidedefs):
         """Pack sidedefs data into binary format"""
@@ -225,10 +253,10 @@ class WADGenerator:
     
     def pack_vertexes(self, vertexes):
         """Pack vertexes data into binary format"""
-        data = bytearray()
-        for v in vertexes:
-            data += struct.pack('<hh', v[0], v[1])
-        return bytes(data)
+        vertexes = np.asarray(vertexes).reshape(-1, 2)
+        if vertexes.size and (vertexes.min() < -0x8000 or vertexes.max() > 0x7FFF):
+            raise ValueError("Vertex coordinate out of signed 16-bit range (map too large)")
+        return vertexes.astype('<i2').tobytes()
     
     def pack_sectors(self, sectors):
         """Pack sectors data into binary format"""
@@ -241,72 +269,135 @@ class WADGenerator:
             data += struct.pack('<hHH', sec[4], sec[5], sec[6])
         return bytes(data)
     
-    def create_new_wad(self, output_file):
-        """Create a new WAD file with MAP00"""
-        # Start building the new WAD
-        new_wad = bytearray()
-        directory = []
-        offset = 12  # Start after header
+    def write_wad(self, stream, maps):
+        """Write a WAD with the given (map_name, map_data) maps to a binary stream
         
-        # Add WAD header placeholder
-        new_wad.extend(b'PWAD')  # We're creating a PWAD (patch WAD)
-        new_wad.extend(b'\0\0\0\0')  # Placeholder for num lumps
-        new_wad.extend(b'\0\0\0\0')  # Placeholder for directory offset
-        
-        # Create and add our new MAP00
-        map_data = self.create_simple_map()
-        
-        # Add MAP00 marker
-        map00_marker = b'MAP00\0\0\0'
-        new_wad.extend(map00_marker)
-        directory.append({
-            'name': 'MAP00',
-            'offset': offset,
-            'size': len(map00_marker)
-        })
-        offset += len(map00_marker)
-        
-        # Add all map lumps
+        The directory offset is known up front from the lump sizes, so the
+        header is written first and nothing has to be patched afterwards.
+        Lumps with identical content are stored once and several directory
+        entries point to the same data block.
+        
+        Returns the number of directory entries and the bytes saved.
+        """
+        # Map marker followed by all map lumps, for every map
         lump_order = ['THINGS', 'LINEDEFS', 'SIDEDEFS', 'VERTEXES', 'SECTORS', 'BLOCKMAP']
-        for lump_name in lump_order:
-            lump_data = map_data[lump_name]
-            new_wad.extend(lump_data)
+        lumps = []
+        for map_name, map_data in maps:
+            lumps.append((map_name, map_name.ljust(8, '\0').encode('ascii')))
+            lumps += [(name, map_data[name]) for name in lump_order]
+        
+        directory = []
+        blocks = []  # Unique data blocks in file order
+        block_offsets = {}  # (size, content hash) -> offset
+        offset = 12  # Start after header
+        saved = 0
+        for lump_name, lump_data in lumps:
+            key = (len(lump_data), hashlib.sha1(lump_data).digest())
+            if key in block_offsets:
+                saved += len(lump_data)
+            else:
+                block_offsets[key] = offset
+                blocks.append(lump_data)
+                offset += len(lump_data)
             directory.append({
                 'name': lump_name,
-                'offset': offset,
+                'offset': block_offsets[key],
                 'size': len(lump_data)
             })
-            offset += len(lump_data)
+        
+        # Header: we're creating a PWAD (patch WAD)
+        stream.write(b'PWAD')
+        stream.write(struct.pack('<II', len(directory), offset))
+        
+        for lump_data in blocks:
+            stream.write(lump_data)
         
         # Now write the directory
-        dir_offset = len(new_wad)
         for entry in directory:
-            # Write directory entry
-            new_wad.extend(struct.pack('<II', entry['offset'], entry['size']))
             name = entry['name'].ljust(8, '\0').encode('ascii')
-            new_wad.extend(name)
+            stream.write(struct.pack('<II', entry['offset'], entry['size']) + name)
+        
+        return len(directory), saved
+    
+    def compression_level(self, size):
+        """Pick a zlib level for a map of the given size in bytes"""
+        # Small maps compress instantly at any level; huge mazes are mostly
+        # repeated LINEDEFS/VERTEXES records, where fast levels get nearly
+        # the same ratio in a fraction of the time
+        if size < 1 << 20:
+            return 9
+        if size < 16 << 20:
+            return 6
+        return 1
+    
+    def create_new_pk3(self, output_file, maze_files):
+        """Create a PK3 (zip) archive with maps/MAPxx.wad, one per maze file
+        
+        Each map is generated, deflated into its own entry and dropped before
+        the next one is built, so memory does not grow with the map count.
+        """
+        with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED) as pk3:
+            for i, maze_file in enumerate(maze_files):
+                map_name = f"MAP{i:02d}"
+                map_data = self.create_simple_map(maze_file)
+                size = 12 + 8 + sum(len(lump) for lump in map_data.values()) + 16 * (len(map_data) + 1)
+                level = self.compression_level(size)
+                pk3.compresslevel = level  # Applies to entries opened after this
+                with pk3.open(f'maps/{map_name}.wad', 'w', force_zip64=size > 0x7FFFFFFF) as f:
+                    self.write_wad(f, [(map_name, map_data)])
+                del map_data
+                print(f"{map_name}: deflate level {level}, {size} bytes")
+        
+        print(f"Successfully created {output_file} with {len(maze_files)} maps "
+              f"({os.path.getsize(output_file)} bytes)")
+    
+    def create_new_wad(self, output_file, maze_files=None):
+        """Create a new WAD file with MAP00, MAP01, ... (one map per maze file)
         
-        # Update header with correct values
-        new_wad[4:8] = struct.pack('<I', len(directory))
-        new_wad[8:12] = struct.pack('<I', dir_offset)
+        A PK3 archive is created instead if output_file ends with .pk3.
+        """
+        maze_files = maze_files or [self.maze_file]
+        
+        if output_file.lower().endswith('.pk3'):
+            self.create_new_pk3(output_file, maze_files)
+            return
+        
+        # Create our new maps; all of them are needed up front to share
+        # identical lumps and to write the directory offset in the header
+        maps = [(f"MAP{i:02d}", self.create_simple_map(maze_file))
+                for i, maze_file in enumerate(maze_files)]
         
         # Write the new WAD file
         with open(output_file, 'wb') as f:
-            f.write(new_wad)
+            num_lumps, saved = self.write_wad(f, maps)
         
-        print(f"Successfully created {output_file} with {len(directory)} lumps")
+        print(f"Successfully created {output_file} with {num_lumps} lumps "
+              f"({saved} bytes shared between identical lumps)")
+
+USAGE = "Usage: python script.py output.wad|output.pk3 [maze_file.txt ...] [doom2.wad]"
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python script.py output.wad [maze_file.txt]")
+        print(USAGE)
         return
     
     output_wad = sys.argv[1]
-    maze_file = sys.argv[2] if len(sys.argv) > 2 else None
+    # Every .txt argument is a maze (one map each), a .wad argument is the IWAD
+    maze_files = [arg for arg in sys.argv[2:] if not arg.lower().endswith('.wad')]
+    iwad_files = [arg for arg in sys.argv[2:] if arg.lower().endswith('.wad')]
+    iwad_file = iwad_files[0] if iwad_files else None
+    if iwad_file is None and os.path.exists("doom2.wad"):
+        iwad_file = "doom2.wad"
+    
+    missing = [path for path in maze_files + iwad_files if not os.path.exists(path)]
+    if missing:
+        print(f"Error: File(s) not found: {', '.join(missing)}")
+        print(USAGE)
+        sys.exit(1)
     
-    print("Creating new WAD with MAP00...")
-    generator = WADGenerator(maze_file)
-    generator.create_new_wad(output_wad)
+    print(f"Creating new WAD with {max(len(maze_files), 1)} map(s) starting at MAP00...")
+    generator = WADGenerator(maze_files[0] if maze_files else None, iwad_file)
+    generator.create_new_wad(output_wad, maze_files or None)
     
     print("Done!")
 
@@ -0,0 +1,190 @@
+import struct
+import os
+import mmap
+import json
+import hashlib
+import random
+
+# Версия формата кэша; при изменении формата старые файлы просто пересоздаются
+INDEX_VERSION = 2
+CACHE_DIR = '.iwad_cache'
+
+# Текстура "-" означает отсутствие текстуры на стороне стены
+NO_TEXTURE = '-'
+
+
+def lump_name(raw):
+    """Имя lump'а / текстуры из 8 байт"""
+    return raw.split(b'\0', 1)[0].decode('ascii', 'replace').upper()
+
+
+def iwad_hash(mm):
+    """SHA-1 содержимого IWAD"""
+    return hashlib.sha1(mm).hexdigest()
+
+
+def read_directory(mm):
+    """Чтение директории WAD файла: список (name, offset, size)"""
+    wad_type = mm[:4]
+    if wad_type not in (b'IWAD', b'PWAD'):
+        raise ValueError(f"Not a WAD file (header {wad_type!r})")
+    num_lumps, info_table_offset = struct.unpack('<II', mm[4:12])
+
+    directory = []
+    for i in range(num_lumps):
+        offset = info_table_offset + i * 16
+        lump_offset, lump_size = struct.unpack('<II', mm[offset:offset+8])
+        directory.append((lump_name(mm[offset+8:offset+16]), lump_offset, lump_size))
+    return directory
+
+
+def parse_pnames(mm, offset, size):
+    """Парсинг PNAMES: список имён патчей"""
+    count = struct.unpack('<I', mm[offset:offset+4])[0]
+    return [lump_name(mm[offset+4+i*8:offset+12+i*8]) for i in range(count)]
+
+
+def parse_texture_lump(mm, offset, size):
+    """Парсинг TEXTURE1/TEXTURE2: список имён текстур"""
+    count = struct.unpack('<I', mm[offset:offset+4])[0]
+    offsets = struct.unpack(f'<{count}I', mm[offset+4:offset+4+count*4])
+    return [lump_name(mm[offset+o:offset+o+8]) for o in offsets]
+
+
+def parse_flats(directory):
+    """Имена flat'ов между F_START/FF_START и F_END/FF_END"""
+    flats = []
+    inside = False
+    for name, _, size in directory:
+        if name in ('F_START', 'FF_START'):
+            inside = True
+        elif name in ('F_END', 'FF_END'):
+            inside = False
+        elif inside and size > 0:  # F1_START и т.п. — пустые маркеры
+            flats.append(name)
+    return flats
+
+
+class IWADIndex:
+    """Набор допустимых текстур и flat'ов из IWAD"""
+
+    def __init__(self, textures, flats, patches, sha1=None, null_texture=None):
+        self.textures = frozenset(textures)
+        self.flats = frozenset(flats)
+        self.patches = frozenset(patches)
+        self.sha1 = sha1
+        # Первая текстура TEXTURE1 (AASHITTY в doom2.wad) движок считает
+        # "нет текстуры" - стены с ней невидимы
+        self.null_texture = null_texture
+        self._texture_list = sorted(self.textures - {null_texture})
+        self._flat_list = sorted(self.flats - {'F_SKY1'})
+
+    @classmethod
+    def build(cls, iwad_file):
+        """Построение индекса напрямую из IWAD"""
+        with open(iwad_file, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return cls._build_from_mmap(mm, iwad_hash(mm))
+
+    @classmethod
+    def _build_from_mmap(cls, mm, sha1):
+        directory = read_directory(mm)
+        lumps = {name: (offset, size) for name, offset, size in directory}
+
+        textures = []
+        null_texture = None
+        for name in ('TEXTURE1', 'TEXTURE2'):
+            if name in lumps:
+                names = parse_texture_lump(mm, *lumps[name])
+                if name == 'TEXTURE1' and names:
+                    null_texture = names[0]
+                textures += names
+        patches = parse_pnames(mm, *lumps['PNAMES']) if 'PNAMES' in lumps else []
+        flats = parse_flats(directory)
+
+        return cls(textures, flats, patches, sha1, null_texture)
+
+    @classmethod
+    def load(cls, iwad_file, cache_dir=None):
+        """Загрузка индекса из кэша (по хэшу IWAD) или построение и сохранение"""
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(iwad_file)), CACHE_DIR)
+
+        with open(iwad_file, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                sha1 = iwad_hash(mm)
+                cache_file = os.path.join(cache_dir, f"{sha1}.json")
+
+                try:
+                    with open(cache_file, 'r') as cf:
+                        cached = json.load(cf)
+                    if cached.get('version') == INDEX_VERSION:
+                        return cls(cached['textures'], cached['flats'], cached['patches'], sha1,
+                                   cached['null_texture'])
+                except (IOError, ValueError, KeyError):
+                    pass
+
+                index = cls._build_from_mmap(mm, sha1)
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file, 'w') as cf:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'textures': sorted(index.textures),
+                    'flats': sorted(index.flats),
+                    'patches': sorted(index.patches),
+                    'null_texture': index.null_texture,
+                }, cf)
+        except IOError as e:
+            print(f"Warning: could not save IWAD index cache: {e}")
+
+        return index
+
+    def is_texture(self, name):
+        if name == NO_TEXTURE:
+            return True
+        name = name.upper()
+        return name != self.null_texture and name in self.textures
+
+    def is_flat(self, name):
+        return name.upper() in self.flats
+
+    def check_sidedefs(self, sidedefs):
+        """Список (index, texture) для неизвестных текстур в sidedefs"""
+        bad = []
+        for i, sd in enumerate(sidedefs):
+            for tex in sd[2:5]:
+                if not self.is_texture(tex):
+                    bad.append((i, tex))
+        return bad
+
+    def check_sectors(self, sectors):
+        """Список (index, flat) для неизвестных flat'ов в sectors"""
+        bad = []
+        for i, sec in enumerate(sectors):
+            for flat in sec[2:4]:
+                if not self.is_flat(flat):
+                    bad.append((i, flat))
+        return bad
+
+    def random_texture(self, rng=random):
+        return rng.choice(self._texture_list)
+
+    def random_flat(self, rng=random):
+        # F_SKY1 — служебный flat неба, в случайную тему не попадает
+        return rng.choice(self._flat_list)
+
+
+# Использование
+if __name__ == "__main__":
+    import sys
+
+    iwad_file = sys.argv[1] if len(sys.argv) > 1 else "doom2.wad"
+
+    if os.path.exists(iwad_file):
+        index = IWADIndex.load(iwad_file)
+        print(f"{iwad_file}: {len(index.textures)} textures, "
+              f"{len(index.flats)} flats, {len(index.patches)} patches")
+    else:
+        print(f"Error: File {iwad_file} not found")
@@ -1,22 +1,35 @@
 # Генератор лабиринта
 import random
 import sys
+import array
 import argparse
+import os
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # Константы
 EXIT_FLAG = 16  # Пятый бит для пометки выхода
 
 class MazeGenerator:
-    def __init__(self, width=6, height=8):
+    def __init__(self, width=6, height=8, seed=None):
         self.width = width
         self.height = height
+        self.rng = random.Random(seed) if seed is not None else random
         self.maze = [[15 for _ in range(width)] for _ in range(height)]
+        # Глубина каждой клетки в дереве обхода (индекс y*width + x) - длина
+        # пути от стартовой клетки обхода до клетки
+        self.depth = array.array('i', [0]) * (width * height)
         self.generate_maze()
 
-    def generate_maze(self, start_x=0, start_y=0):
+    def generate_maze(self, start_x=0, start_y=None):
+        """Обход в глубину; по умолчанию старт со входа (левая нижняя клетка),
+        тогда depth - длина пути от входа, её использует score_mazes"""
+        if start_y is None:
+            start_y = self.height - 1
         stack = [(start_x, start_y)]
         visited = set(stack)
+        self.depth[start_y * self.width + start_x] = 0
         
         while stack:
             x, y = stack[-1]
@@ -33,7 +46,7 @@ class MazeGenerator:
                 neighbors.append(('down', x, y+1))
             
             if neighbors:
-                direction, nx, ny = random.choice(neighbors)
+                direction, nx, ny = self.rng.choice(neighbors)
                 
                 # Убираем стену между текущей клеткой и соседом
                 if direction == 'left':
@@ -49,6 +62,7 @@ class MazeGenerator:
                     self.maze[y][x] &= ~8  # Убираем нижнюю стену текущей клетки
                     self.maze[ny][nx] &= ~2  # Убираем верхнюю стену соседней
                 
+                self.depth[ny * self.width + nx] = len(stack)
                 stack.append((nx, ny))
                 visited.add((nx, ny))
             else:
@@ -86,16 +100,112 @@ class MazeGenerator:
             print(f"Ошибка при сохранении файла: {e}")
             return False
 
+def build_candidate(args):
+    """Построение одного лабиринта-кандидата (для пула процессов)"""
+    width, height, seed = args
+    return MazeGenerator(width, height, seed)
+
+def corridor_runs(open_mask):
+    """Длины прямых коридоров вдоль последней оси: (номер лабиринта, длина)"""
+    n = open_mask.shape[0]
+    padded = np.zeros(open_mask.shape[:-1] + (open_mask.shape[-1] + 1,), dtype=np.int8)
+    padded[..., 1:] = open_mask
+    edges = np.diff(padded.reshape(-1), append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts // (padded.size // n), ends - starts
+
+def score_mazes(mazes, depths, width, height):
+    """Метрики сложности для пачки лабиринтов (все массивы длины N)
+    
+    mazes - массив (N, height, width), depths - (N, width*height) глубины
+    клеток от входа (MazeGenerator.depth).
+    """
+    grid = np.asarray(mazes, dtype=np.int16) & 15
+    n = grid.shape[0]
+    cells = width * height
+
+    walls = sum((grid >> bit) & 1 for bit in range(4))
+    openings = 4 - walls
+
+    # Вход - левая нижняя клетка, выход - правая верхняя
+    length = np.asarray(depths)[:, width - 1] + 1
+    dead_ends = np.count_nonzero(openings == 1, axis=(1, 2))
+    junctions = np.count_nonzero(openings >= 3, axis=(1, 2))
+    branching = np.where(openings >= 2, openings - 1, 0).sum(axis=(1, 2)) / \
+        np.maximum(np.count_nonzero(openings >= 2, axis=(1, 2)), 1)
+
+    # Прямые коридоры: открыто слева и справа / сверху и снизу
+    h_id, h_len = corridor_runs((grid & 5) == 0)
+    v_id, v_len = corridor_runs(np.swapaxes((grid & 10) == 0, 1, 2))
+    run_id = np.concatenate([h_id, v_id])
+    run_len = np.concatenate([h_len, v_len])
+    runs = np.bincount(run_id, minlength=n)
+    corridor_mean = np.bincount(run_id, weights=run_len, minlength=n) / np.maximum(runs, 1)
+    corridor_max = np.zeros(n, dtype=np.int64)
+    np.maximum.at(corridor_max, run_id, run_len)
+
+    # Сложность 0..1: длинный путь, много тупиков и развилок, короткие коридоры
+    difficulty = (0.4 * length / cells
+                  + 0.2 * np.minimum(1, 4 * dead_ends / cells)
+                  + 0.2 * np.minimum(1, 4 * junctions / cells)
+                  + 0.2 / np.maximum(corridor_mean, 1))
+
+    return {
+        'solution_length': length,
+        'dead_ends': dead_ends,
+        'junctions': junctions,
+        'branching_factor': branching,
+        'corridor_mean': corridor_mean,
+        'corridor_max': corridor_max,
+        'difficulty': difficulty,
+    }
+
+def best_of(width, height, candidates, target=None, workers=None):
+    """Генерирует candidates лабиринтов и возвращает (лучший, метрики)
+    
+    target - желаемая сложность 0..1; если не задана, берётся самый сложный.
+    """
+    seeds = [(width, height, random.getrandbits(64)) for _ in range(candidates)]
+    workers = min(workers or os.cpu_count() or 1, candidates)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            generators = list(pool.map(build_candidate, seeds, chunksize=max(1, candidates // workers)))
+    else:
+        generators = [build_candidate(args) for args in seeds]
+
+    # Сборка пачки массивов напрямую из байтов (значения клеток < 32)
+    mazes = np.frombuffer(b''.join(bytes(row) for g in generators for row in g.maze),
+                          dtype=np.uint8).reshape(candidates, height, width)
+    depths = np.frombuffer(b''.join(g.depth for g in generators), dtype=np.int32)
+
+    scores = score_mazes(mazes, depths.reshape(candidates, -1), width, height)
+    if target is None:
+        best = int(np.argmax(scores['difficulty']))
+    else:
+        best = int(np.argmin(np.abs(scores['difficulty'] - target)))
+
+    return generators[best], {name: value[best] for name, value in scores.items()}
+
 def main():
     # Настройка парсера аргументов командной строки
     parser = argparse.ArgumentParser(description='Maze Generator')
     parser.add_argument('-o', '--output', required=True, help='Имя файла для сохранения лабиринта')
     parser.add_argument('-w', '--width', type=int, default=6, help='Ширина лабиринта')
     parser.add_argument('-H', '--height', type=int, default=8, help='Высота лабиринта')
+    parser.add_argument('-n', '--candidates', type=int, default=1, help='Количество лабиринтов-кандидатов')
+    parser.add_argument('-d', '--difficulty', type=float, default=None,
+                        help='Желаемая сложность 0..1 (по умолчанию - самый сложный из кандидатов)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Количество процессов для генерации')
     args = parser.parse_args()
 
     # Создаем генератор лабиринта
-    generator = MazeGenerator(args.width, args.height)
+    if args.candidates > 1:
+        generator, scores = best_of(args.width, args.height, args.candidates, args.difficulty, args.jobs)
+        print(f"Выбран лабиринт: путь {scores['solution_length']}, тупиков {scores['dead_ends']}, "
+              f"развилок {scores['junctions']}, сложность {scores['difficulty']:.3f}")
+    else:
+        generator = MazeGenerator(args.width, args.height)
     
     # Сохраняем лабиринт в файл
     if not generator.save_to_file(args.output):
@@ -3,6 +3,10 @@ import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
 import numpy as np
 import os
+import sys
+from lab_gen import EXIT_FLAG
+
+CELL_SIZE = 128  # Размер клетки лабиринта в единицах карты
 
 def read_wad_file(filename):
     """Чтение WAD файла в бинарном режиме"""
@@ -17,7 +21,12 @@ def parse_wad_header(data):
     return wad_type, num_lumps, info_table_offset
 
 def find_map_directory(data, map_name):
-    """Поиск директории для указанной карты"""
+    """Поиск директории для указанной карты
+    
+    Одинаковые lump'ы могут храниться один раз, и несколько записей
+    директории (в том числе разных карт) указывают на один и тот же блок
+    данных - поэтому lump'ы читаются только по (offset, size) записи.
+    """
     wad_type, num_lumps, info_table_offset = parse_wad_header(data)
     
     map_found = False
@@ -29,6 +38,9 @@ def find_map_directory(data, map_name):
         lump_size = struct.unpack('<I', data[offset+4:offset+8])[0]
         lump_name = data[offset+8:offset+16].decode('ascii').rstrip('\0')
         
+        if lump_offset + lump_size > len(data):
+            raise ValueError(f"Lump {lump_name} ({lump_offset}+{lump_size}) points outside the WAD file")
+        
         if lump_name == map_name:
             map_found = True
             continue
@@ -87,6 +99,79 @@ def parse_linedefs(data, offset, size):
     
     return linedefs
 
+def read_vertexes_array(data, offset, size):
+    """Вершины карты как массив (N, 2) int16"""
+    return np.frombuffer(data, dtype='<i2', count=size // 2, offset=offset).reshape(-1, 2)
+
+def read_linedefs_array(data, offset, size):
+    """Линии карты как массив (M, 7) uint16"""
+    return np.frombuffer(data, dtype='<u2', count=size // 2, offset=offset).reshape(-1, 7)
+
+def linedefs_to_maze(vertexes, linedefs, cell_size=CELL_SIZE):
+    """Восстановление сетки лабиринта (битовые маски стен) по линиям карты
+    
+    Стенами лабиринта считаются линии длиной в одну клетку, лежащие на
+    границах клеток; внешняя рамка и линия выхода на сетку не попадают.
+    """
+    vertexes = np.asarray(vertexes, dtype=np.int64)
+    linedefs = np.asarray(linedefs, dtype=np.int64)
+    
+    # Размер лабиринта по вершинам, лежащим на сетке клеток
+    on_grid = (vertexes % cell_size == 0).all(axis=1)
+    width, height = (int(c) for c in (vertexes[on_grid] // cell_size).max(axis=0, initial=0))
+    if width == 0 or height == 0:
+        print("No maze grid found in the map")
+        return None, None, None
+    grid = np.zeros((height, width), dtype=np.int32)
+    
+    start = vertexes[linedefs[:, 0]]
+    end = vertexes[linedefs[:, 1]]
+    lo = np.minimum(start, end)
+    delta = np.abs(end - start)
+    is_wall = on_grid[linedefs[:, 0]] & on_grid[linedefs[:, 1]]
+    horizontal = is_wall & (delta[:, 1] == 0) & (delta[:, 0] == cell_size)
+    vertical = is_wall & (delta[:, 0] == 0) & (delta[:, 1] == cell_size)
+    
+    # Горизонтальная граница в строке r: снизу клетки r, сверху клетки r-1
+    x, r = (lo[horizontal] // cell_size).T
+    grid[r[r < height], x[r < height]] |= 2
+    grid[r[r > 0] - 1, x[r > 0]] |= 8
+    
+    # Вертикальная граница в столбце c: слева клетки c, справа клетки c-1
+    c, y = (lo[vertical] // cell_size).T
+    grid[y[c < width], c[c < width]] |= 1
+    grid[y[c > 0], c[c > 0] - 1] |= 4
+    
+    # Флаг выхода в WAD не хранится, lab_gen.py всегда ставит его правой верхней клетке
+    grid[0, width-1] |= EXIT_FLAG
+    
+    return width, height, grid
+
+def save_maze(width, height, grid, output_filename):
+    """Сохранение лабиринта в текстовом формате lab_gen.py"""
+    with open(output_filename, 'w') as f:
+        f.write(f"{width} {height}\n")
+        for row in grid:
+            f.write(" ".join(map(str, row)) + "\n")
+    print(f"Maze saved to {output_filename}")
+
+def extract_maze(wad_filename, map_name):
+    """Извлечение лабиринта (width, height, grid) из сгенерированной карты"""
+    data = read_wad_file(wad_filename)
+    map_lumps = find_map_directory(data, map_name)
+    
+    if not map_lumps:
+        print(f"Map {map_name} not found in WAD file")
+        return None, None, None
+    
+    if 'VERTEXES' not in map_lumps or 'LINEDEFS' not in map_lumps:
+        print("Required map data (VERTEXES or LINEDEFS) not found")
+        return None, None, None
+    
+    vertexes = read_vertexes_array(data, *map_lumps['VERTEXES'])
+    linedefs = read_linedefs_array(data, *map_lumps['LINEDEFS'])
+    return linedefs_to_maze(vertexes, linedefs)
+
 def draw_map(vertexes, linedefs, output_filename):
     """Рисование карты"""
     fig, ax = plt.subplots(figsize=(20, 20))
@@ -143,12 +228,20 @@ def extract_and_draw_map(wad_filename, map_name, output_filename):
     # Рисуем карту
     draw_map(vertexes, linedefs, output_filename)
 
-# Использование
+# Использование:
+#   python map_extractor.py [minotaur.wad] [minotaur_map00.png]
+#   python map_extractor.py minotaur.wad minotaur.txt  - восстановить лабиринт
+#   python map_extractor.py minotaur.wad map01.png MAP01  - другая карта из wad
 if __name__ == "__main__":
-    wad_file = "minotaur.wad"
-    output_file = "minotaur_map00.png"
-    
-    if os.path.exists(wad_file):
-        extract_and_draw_map(wad_file, "MAP00", output_file)
+    wad_file = sys.argv[1] if len(sys.argv) > 1 else "minotaur.wad"
+    output_file = sys.argv[2] if len(sys.argv) > 2 else "minotaur_map00.png"
+    map_name = sys.argv[3] if len(sys.argv) > 3 else "MAP00"
+    
+    if not os.path.exists(wad_file):
+        print(f"Error: File {wad_file} not found")
+    elif output_file.endswith('.txt'):
+        width, height, grid = extract_maze(wad_file, map_name)
+        if grid is not None:
+            save_maze(width, height, grid, output_file)
     else:
-        print(f"Error: File {wad_file} not found")
\ No newline at end of file
+        extract_and_draw_map(wad_file, map_name, output_file)